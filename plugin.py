@@ -5,21 +5,38 @@ Supports food search, barcode lookup, dietary profile management, and specialize
 
 import json
 import sys
+import orjson
 import requests
+import requests_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import logging
 import os
+import queue
 import re
 import ast
-from ctypes import byref, windll, wintypes
+import atexit
+from datetime import timedelta
+from logging.handlers import QueueHandler, QueueListener
+from urllib.parse import quote_plus
 from typing import Optional, Dict, Any
 
+# The command pipe is only available through the Windows API; guarding the import keeps the
+# module importable on other platforms, e.g. for running the search functions directly.
+if sys.platform == 'win32':
+    from ctypes import byref, c_char, windll, wintypes
+
 # Type definitions
 Response = Dict[str, Any]
 
 # Global user profile for dietary restrictions and preferences
 USER_PROFILE = None
+# Lookups derived from USER_PROFILE by build_profile_lookups(), assigned together with it whenever the profile changes
+PROFILE_LOOKUPS = {}
 PROFILE_DIR = os.path.join(os.environ.get('USERPROFILE', '.'), 'DietCheck')
 PROFILE_FILE = os.path.join(PROFILE_DIR, 'dietcheck-profile.json')
+# Serialized profile most recently written to PROFILE_FILE, used to skip redundant saves
+LAST_SAVED_PROFILE = None
 
 # Configure logging with a detailed format
 LOG_FILE = os.path.join(PROFILE_DIR, 'dietcheck-plugin.log')
@@ -27,12 +44,234 @@ LOG_FILE = os.path.join(PROFILE_DIR, 'dietcheck-plugin.log')
 # Create the directory for logs if it doesn't exist
 os.makedirs(PROFILE_DIR, exist_ok=True)
 
+# Log level can be raised (e.g. DIETCHECK_LOG_LEVEL=WARNING) to keep per-request records out of the log file
+LOG_LEVEL = os.environ.get('DIETCHECK_LOG_LEVEL', 'INFO').upper()
+
 logging.basicConfig(
     filename=LOG_FILE,
-    level=logging.INFO,
+    level=getattr(logging, LOG_LEVEL, logging.INFO),
     format="%(asctime)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s"
 )
 
+# Hand the file handler to a background listener thread, so logging a record never blocks a
+# command on disk I/O. The root logger only puts records on the queue; QueueHandler still
+# formats the message on the calling thread, so only the line layout and the write move off it.
+LOG_QUEUE = queue.SimpleQueue()
+root_logger = logging.getLogger()
+LOG_LISTENER = QueueListener(LOG_QUEUE, *root_logger.handlers, respect_handler_level=True)
+root_logger.handlers = [QueueHandler(LOG_QUEUE)]
+LOG_LISTENER.start()
+# Flush the queued records however the process exits, including after an unhandled exception
+atexit.register(LOG_LISTENER.stop)
+
+# Module logger; records propagate to the queue handler on the root logger
+logger = logging.getLogger(__name__)
+
+def parse_json_response(response) -> Any:
+    """
+    Decode the JSON body of an Open Food Facts response.
+
+    Uses orjson directly on the raw bytes, which is considerably faster than the
+    stdlib decoder behind response.json() on large search payloads. Decode errors
+    are raised as orjson.JSONDecodeError, a subclass of json.JSONDecodeError.
+    """
+    return orjson.loads(response.content)
+
+# Persistent HTTP cache for Open Food Facts lookups. Product pages rarely change,
+# so barcode lookups are kept for 30 days; search results expire after a day.
+# Cache-Control/ETag headers sent by the server take precedence when present.
+HTTP_CACHE_FILE = os.path.join(PROFILE_DIR, 'http_cache.sqlite')
+
+SESSION = requests_cache.CachedSession(
+    HTTP_CACHE_FILE,
+    expire_after=timedelta(days=1),
+    urls_expire_after={
+        'world.openfoodfacts.org/api/v0/product/*': timedelta(days=30),
+    },
+    cache_control=True,
+)
+
+# (connect, read) timeouts in seconds. An unreachable server fails after a few seconds,
+# while slow full-text searches still get their long read budget.
+SEARCH_TIMEOUT = (5, 80)
+PRODUCT_TIMEOUT = (5, 10)
+LABEL_SEARCH_TIMEOUT = (5, 10)
+
+# Keep connections to Open Food Facts alive between calls and retry transient
+# server errors and rate limiting instead of failing the whole request.
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+))
+
+# Open Food Facts asks API clients to identify themselves with a User-Agent. Compressed
+# responses are requested explicitly; brotli is left out since urllib3 only decodes it
+# when the optional brotli package is installed.
+SESSION.headers.update({
+    'User-Agent': 'DietCheck/1.0.0 (https://github.com/cindyhuen/dietcheck)',
+    'Accept-Encoding': 'gzip, deflate',
+})
+
+# Open Food Facts search endpoint; query parameters are passed separately so requests URL-encodes them
+OFF_SEARCH_URL = "https://world.openfoodfacts.org/cgi/search.pl"
+
+# search_safe_food_only checks at most 20 products, so its searches ask for no more than that
+SAFE_SEARCH_PAGE_SIZE = 20
+
+# "Barcode: XXXXXXXXX" in a formatted result line
+BARCODE_RE = re.compile(r'Barcode: (\w+)')
+
+# Fixed parts of the search result messages, built once instead of on every search
+REFERENCE_NOTE = "\n\nNote: These results are for reference only. Please check the actual product packaging for the most accurate information."
+SAFE_SEARCH_FILTER_REASONS = "• Allergen conflicts\n• Unknown vegan/vegetarian status\n• Nutrient limit violations\n• Missing critical information\n\n"
+SAFE_SEARCH_VEGAN_REMINDER = "🥗 Vegan requirement (strict - excludes unknown status)\n"
+SAFE_SEARCH_VEGETARIAN_REMINDER = "🥛 Vegetarian requirement (strict - excludes unknown status)\n"
+SAFE_SEARCH_TRY_HINT = "\n💡 Try: \n- Use regular search to see products with warnings\n- Try different/broader search terms\n- Use analyze_product to check specific barcodes\n- Consider adjusting your dietary profile if needed"
+SAFE_SEARCH_MORE_RESULTS = "\n\n📝 Showing first 10 safe results. There may be more safe options available."
+SAFE_SEARCH_REQUIREMENTS_HEADER = "\n\n• All listed products meet your dietary requirements:\n"
+
+# Product fields read by the plugin. Requesting only these keeps the server from sending
+# (and us from decoding) the rest of each product document.
+OFF_PRODUCT_FIELDS = ",".join([
+    'code', 'product_name', 'generic_name', 'brands', 'nutriments',
+    'ingredients_text', 'ingredients_analysis_tags', 'allergens_tags', 'traces',
+    'additives_tags', 'categories', 'categories_tags', 'labels', 'labels_tags'
+])
+
+# Nutrients read from the Open Food Facts 'nutriments' dict, with the per-100g key tried first
+NUTRIENT_FIELDS = {
+    'calories': ('energy-kcal_100g', 'energy-kcal'),
+    'fat': ('fat_100g', 'fat'),
+    'fiber': ('fiber_100g', 'fiber'),
+    'sugar': ('sugars_100g', 'sugars'),
+    'salt': ('salt_100g', 'salt'),
+    'protein': ('proteins_100g', 'proteins'),
+}
+
+def extract_nutrient_values(nutriments: dict) -> dict:
+    """
+    Look up the nutrients in NUTRIENT_FIELDS once, so filtering and formatting share the values.
+    
+    Returns:
+        dict: Nutrient name to its raw value, or None when the product does not report it
+    """
+    return {name: nutriments.get(key_100g, nutriments.get(key)) for name, (key_100g, key) in NUTRIENT_FIELDS.items()}
+
+# Nutrient filters accepted by search_food_product, applied to per-100g values:
+# (parameter, "low" flag enabling a default limit, default limit, nutrient, 'max' or 'min', summary text)
+NUTRIENT_FILTERS = [
+    ('max_fat', 'low_fat', 3.0, 'fat', 'max', "Low fat (≤{limit}g)"),
+    ('max_fiber', 'low_fiber', 3.0, 'fiber', 'max', "Low fiber (≤{limit}g)"),
+    ('max_sugar', 'low_sugar', 5.0, 'sugar', 'max', "Low sugar (≤{limit}g)"),
+    ('max_salt', 'low_salt', 0.3, 'salt', 'max', "Low salt (≤{limit}g)"),
+    ('max_calories', None, None, 'calories', 'max', "≤{limit} calories"),
+    ('min_calories', None, None, 'calories', 'min', "≥{limit} calories"),
+    ('min_fiber', None, None, 'fiber', 'min', "≥{limit}g fiber"),
+    ('min_protein', None, None, 'protein', 'min', "≥{limit}g protein"),
+    ('max_protein', None, None, 'protein', 'max', "≤{limit}g protein"),
+]
+
+# How a filtered nutrient is shown next to a search result, in display order
+NUTRIENT_DISPLAY_FORMATS = {
+    'calories': "{} kcal",
+    'fat': "{}g fat",
+    'sugar': "{}g sugar",
+    'salt': "{}g salt",
+    'fiber': "{}g fiber",
+    'protein': "{}g protein",
+}
+
+def describe_nutrient_filters(active_filters: list, no_nuts: bool) -> str:
+    """Return the human-readable summary of the active search filters, e.g. 'Low fat (≤3.0g), No nuts'."""
+    filter_summary = [summary for _, _, _, summary in active_filters]
+    if no_nuts:
+        filter_summary.append("No nuts")
+    return ', '.join(filter_summary)
+
+# Words that indicate nuts in product text. A word counts if it ends in 'nut'/'nuts', which
+# covers compounds such as 'groundnut', 'pinenuts' or 'cashewnuts', or if it contains one of
+# the nut names, as in 'peanutbutter' or 'arachis' (peanut) oil.
+NUTS_WORD_RE = re.compile(r'nuts?$|almond|cashew|pistachio|pecan|macadamia|peanut|walnut|hazelnut|groundnut|arachis')
+# Words matching NUTS_WORD_RE that are not tree nuts or peanuts
+NOT_NUTS_WORDS = frozenset({
+    'coconut', 'coconuts', 'nutmeg', 'nutmegs', 'butternut', 'butternuts',
+    'doughnut', 'doughnuts', 'donut', 'donuts'
+})
+WORD_SPLIT_RE = re.compile(r'[^a-z]+')
+
+def text_mentions_nuts(text: str) -> bool:
+    """
+    Return True if lowercased text contains a nut word, matched per word rather than as a substring.
+    
+    Example:
+        >>> [text_mentions_nuts(word) for word in ['groundnut', 'groundnuts', 'cashewnuts', 'pinenuts', 'peanutbutter', 'arachis']]
+        [True, True, True, True, True, True]
+        >>> text_mentions_nuts('sugar, groundnut oil, salt'), text_mentions_nuts('en:tree-nuts')
+        (True, True)
+        >>> [text_mentions_nuts(word) for word in ['coconut', 'coconuts', 'nutmeg', 'butternut', 'doughnut', 'donuts']]
+        [False, False, False, False, False, False]
+        >>> text_mentions_nuts('en:coconut-milks')
+        False
+    """
+    return any(
+        word not in NOT_NUTS_WORDS and NUTS_WORD_RE.search(word)
+        for word in set(WORD_SPLIT_RE.split(text))
+    )
+
+def nutriments_contain_nuts(nutriments: dict) -> bool:
+    """Return True if any nut-related nutriments entry has a non-zero amount."""
+    for key, value in nutriments.items():
+        key_lower = key.lower()
+        # fruits-vegetables-nuts* is the combined Nutri-Score estimate, not evidence of nuts
+        if 'fruits-vegetables' in key_lower or not text_mentions_nuts(key_lower):
+            continue
+        try:
+            if float(value) > 0:
+                return True
+        except (TypeError, ValueError):
+            continue
+    return False
+
+# Product text fields and tag lists checked for nut words, besides the nutriments
+NUTS_TEXT_FIELDS = ('ingredients_text', 'product_name', 'generic_name', 'categories', 'labels', 'traces')
+NUTS_TAG_FIELDS = ('allergens_tags', 'ingredients_analysis_tags', 'categories_tags', 'labels_tags')
+
+def product_contains_nuts(product: dict) -> bool:
+    """
+    Check a product's allergen tags, ingredients, other text fields and nutriments for nuts.
+    
+    Shared by the no_nuts search filter and the nut allergy check, so both flag the same products.
+    """
+    # The fields are lowercased and joined once; the separator is not a letter, so one split covers them all
+    text = '|'.join(
+        [str(product.get(field) or '') for field in NUTS_TEXT_FIELDS]
+        + [str(item) for field in NUTS_TAG_FIELDS for item in product.get(field) or []]
+    ).lower()
+    return text_mentions_nuts(text) or nutriments_contain_nuts(product.get('nutriments') or {})
+
+# Ingredients that rule out a vegan or vegetarian product, in the order they are reported
+NON_VEGAN_INDICATORS = ["milk", "egg", "meat", "fish", "honey", "gelatin", "whey", "casein", "dairy", "cheese", "butter", "cream", "lactose", "chicken", "beef", "pork", "bacon", "lard"]
+NON_VEGETARIAN_INDICATORS = ["meat", "fish", "chicken", "beef", "pork", "bacon", "lard", "gelatin", "anchovies", "tuna", "salmon", "cod"]
+# Single-pass test for "contains any indicator"; the list is only walked to name the offending one
+NON_VEGAN_RE = re.compile('|'.join(re.escape(indicator) for indicator in NON_VEGAN_INDICATORS))
+NON_VEGETARIAN_RE = re.compile('|'.join(re.escape(indicator) for indicator in NON_VEGETARIAN_INDICATORS))
+
+# ASCII control characters (0-31 and DEL), the only non-printable characters left after dropping non-ASCII
+ASCII_CONTROL_CHARS = dict.fromkeys([*range(32), 127])
+
+def clean_text(text: str) -> str:
+    """
+    Keep only printable ASCII characters, for product names and brands shown in responses.
+    
+    Equivalent to filtering each character with isprintable() and isascii(), but done
+    with two C-level passes instead of a Python loop over every character.
+    """
+    return text.encode('ascii', 'ignore').decode('ascii').translate(ASCII_CONTROL_CHARS)
+
+# Strings that may be Python literals rather than JSON: a container or quoted string, or a Python constant
+PYTHON_LITERAL_RE = re.compile(r"^\s*[\[{(']|\b(?:True|False|None)\b")
+
 def safe_parse_parameter(param_value, expected_type):
     """
     Safely parse a parameter that might be a string representation of a Python object.
@@ -59,61 +298,156 @@ def safe_parse_parameter(param_value, expected_type):
         
         try:
             # Try JSON parsing first (handles "true"/"false" properly)
-            parsed = json.loads(param_value)
+            parsed = orjson.loads(param_value)
             if isinstance(parsed, expected_type):
                 return parsed
         except (json.JSONDecodeError, ValueError):
-            pass
-        
-        try:
-            # Try ast.literal_eval for Python literals
-            parsed = ast.literal_eval(param_value)
-            if isinstance(parsed, expected_type):
-                return parsed
-        except (ValueError, SyntaxError):
-            pass
+            # Only strings that look like Python literals are worth handing to the ast parser
+            if PYTHON_LITERAL_RE.search(param_value):
+                try:
+                    # Try ast.literal_eval for Python literals
+                    parsed = ast.literal_eval(param_value)
+                    if isinstance(parsed, expected_type):
+                        return parsed
+                except (ValueError, SyntaxError):
+                    pass
         
         # If expected type is list/dict and we have a string, try to create empty one
         if expected_type in [list, dict]:
-            logging.warning(f"Could not parse parameter '{param_value}' as {expected_type.__name__}, using empty {expected_type.__name__}")
+            logger.warning("Could not parse parameter '%s' as %s, using empty %s", param_value, expected_type.__name__, expected_type.__name__)
             return expected_type()
     
     # Return original value if parsing failed
-    logging.warning(f"Parameter '{param_value}' is not of expected type {expected_type.__name__}")
+    logger.warning("Parameter '%s' is not of expected type %s", param_value, expected_type.__name__)
     return param_value
 
-def save_user_profile():
-    """Save the current user profile to a persistent file."""
-    global USER_PROFILE, PROFILE_FILE, PROFILE_DIR
+# Profile fields holding lists of names
+PROFILE_LIST_FIELDS = ("allergies", "intolerances", "medical_conditions", "avoid_additives")
+
+def normalize_profile(profile: dict) -> dict:
+    """
+    Coerce list entries and dietary preference and nutrient limit keys of a profile to strings, in place.
+    
+    Parameters parsed with ast.literal_eval can hold e.g. [1, "peanut"] or {1: 2}, which the
+    lookups, the profile summary and the saved JSON all expect as strings.
+    """
+    for key in PROFILE_LIST_FIELDS:
+        value = profile.get(key)
+        if isinstance(value, list):
+            profile[key] = [item if isinstance(item, str) else str(item) for item in value]
+    for key in ("dietary_preferences", "nutrient_limits"):
+        value = profile.get(key)
+        if isinstance(value, dict):
+            profile[key] = {str(name): setting for name, setting in value.items()}
+    return profile
+
+def build_profile_lookups(profile: Optional[dict]) -> dict:
+    """
+    Precompute the profile values that product analysis and result messages need on every call.
+    
+    Nothing global is touched, so callers can assign USER_PROFILE and PROFILE_LOOKUPS together
+    once this has succeeded.
+    """
+    if profile is None:
+        return {}
+    
+    dietary_prefs = profile.get("dietary_preferences") or {}
+    nutrient_limits = profile.get("nutrient_limits", {})
+    
+    lookups = {
+        # (allergy as entered, lowercased allergy) pairs
+        "allergies": [(allergy, allergy.lower()) for allergy in profile.get("allergies", [])],
+        # (nutriments key, key without the _100g suffix, limit) triples
+        "nutrient_limits": [
+            (nutrient, nutrient.replace("_100g", ""), limit) for nutrient, limit in nutrient_limits.items()
+        ] if isinstance(nutrient_limits, dict) else [],
+        # Enabled dietary preferences as shown by get_user_profile, e.g. "vegan, low_sugar"
+        "active_prefs": ', '.join(k for k, v in dietary_prefs.items() if v) if isinstance(dietary_prefs, dict) else "",
+        # False when no check in analyze_product_safety could produce a warning or recommendation
+        "has_restrictions": bool(
+            any(profile.get(key) for key in ("allergies", "intolerances", "nutrient_limits", "avoid_additives"))
+            or (any(dietary_prefs.values()) if isinstance(dietary_prefs, dict) else dietary_prefs)
+        ),
+    }
+    
+    # Requirements line shown under the search_safe_food_only results
+    profile_summary = []
+    allergies = profile.get("allergies", [])
+    intolerances = profile.get("intolerances", [])
+    if allergies:
+        profile_summary.append(f"No {', '.join(allergies)} allergens")
+    if intolerances:
+        profile_summary.append(f"No {', '.join(intolerances)}")
+    if isinstance(dietary_prefs, dict) and dietary_prefs.get("vegan"):
+        profile_summary.append("Vegan-friendly")
+    if isinstance(dietary_prefs, dict) and dietary_prefs.get("vegetarian"):
+        profile_summary.append("Vegetarian-friendly")
+    if lookups["nutrient_limits"]:
+        limits_text = [f"{short_nutrient} ≤ {limit}g" for _, short_nutrient, limit in lookups["nutrient_limits"]]
+        profile_summary.append(f"Within limits: {', '.join(limits_text)}")
+    lookups["safe_summary"] = "✅ " + "\n".join(profile_summary) if profile_summary else ""
+    return lookups
+
+def save_user_profile() -> bool:
+    """
+    Save the current user profile to a persistent file.
+    
+    The file is written to a temporary path and moved into place, so a crash mid-write
+    never leaves a truncated profile behind. Nothing is written if the profile is unchanged.
+    
+    Returns:
+        bool: True if the file holds the current profile, False if it could not be saved
+    """
+    global USER_PROFILE, PROFILE_FILE, PROFILE_DIR, LAST_SAVED_PROFILE
     
     if USER_PROFILE is not None:
         try:
+            try:
+                data = orjson.dumps(USER_PROFILE, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+            except orjson.JSONEncodeError:
+                # e.g. integers wider than 64 bits, which orjson rejects but json writes as-is
+                data = json.dumps(USER_PROFILE, indent=2, ensure_ascii=False).encode('utf-8')
+            if data == LAST_SAVED_PROFILE and os.path.exists(PROFILE_FILE):
+                logger.info("User profile unchanged, skipping save")
+                return True
+            
             # Create DietCheck directory if it doesn't exist
             os.makedirs(PROFILE_DIR, exist_ok=True)
             
-            with open(PROFILE_FILE, 'w', encoding='utf-8') as f:
-                json.dump(USER_PROFILE, f, indent=2, ensure_ascii=False)
-            logging.info(f"User profile saved to {PROFILE_FILE}")
+            temp_file = PROFILE_FILE + '.tmp'
+            with open(temp_file, 'wb') as f:
+                f.write(data)
+            os.replace(temp_file, PROFILE_FILE)
+            LAST_SAVED_PROFILE = data
+            logger.info("User profile saved to %s", PROFILE_FILE)
+            return True
         except Exception as e:
-            logging.error(f"Failed to save user profile: {str(e)}")
+            logger.error("Failed to save user profile: %s", e)
+    return False
 
 def load_user_profile():
     """Load the user profile from the persistent file."""
-    global USER_PROFILE, PROFILE_FILE
+    global USER_PROFILE, PROFILE_LOOKUPS, PROFILE_FILE, LAST_SAVED_PROFILE
     
     try:
         if os.path.exists(PROFILE_FILE):
-            with open(PROFILE_FILE, 'r', encoding='utf-8') as f:
-                USER_PROFILE = json.load(f)
+            with open(PROFILE_FILE, 'rb') as f:
+                data = f.read()
+            profile = normalize_profile(orjson.loads(data))
+            lookups = build_profile_lookups(profile)
+            USER_PROFILE, PROFILE_LOOKUPS = profile, lookups
+            # A file written by save_user_profile round-trips to the same bytes, so saving the
+            # profile straight back after a load is recognized as unchanged
+            LAST_SAVED_PROFILE = data
             profile_name = USER_PROFILE.get("profile_name", "Saved Profile")
-            logging.info(f"User profile loaded: {profile_name}")
+            logger.info("User profile loaded: %s", profile_name)
             return True
         else:
-            logging.info("No saved user profile found")
+            logger.info("No saved user profile found")
             return False
     except Exception as e:
-        logging.error(f"Failed to load user profile: {str(e)}")
-        USER_PROFILE = None
+        logger.error("Failed to load user profile: %s", e)
+        USER_PROFILE, PROFILE_LOOKUPS = None, {}
         return False
 
 def search_food_product(params: dict = None) -> dict:
@@ -141,51 +475,45 @@ def search_food_product(params: dict = None) -> dict:
         dict: Search results with product information and safety indicators
     """
     if not params or "product_name" not in params:
-        logging.error("Product name parameter is required in search_food_product")
+        logger.error("Product name parameter is required in search_food_product")
         return {"success": False, "message": "Product name parameter is required."}
     
     product_name = params["product_name"]
     
-    # Extract filtering parameters
-    filters = {
-        'low_fat': params.get('low_fat', False),
-        'low_fiber': params.get('low_fiber', False),
-        'low_sugar': params.get('low_sugar', False),
-        'low_salt': params.get('low_salt', False),
-        'no_nuts': params.get('no_nuts', False),
-        'max_calories': params.get('max_calories'),
-        'min_calories': params.get('min_calories'),
-        'max_fat': params.get('max_fat'),
-        'max_fiber': params.get('max_fiber'),
-        'min_fiber': params.get('min_fiber'),
-        'max_sugar': params.get('max_sugar'),
-        'max_salt': params.get('max_salt'),
-        'min_protein': params.get('min_protein'),
-        'max_protein': params.get('max_protein')
-    }
+    no_nuts = params.get('no_nuts', False)
     
-    # Set default limits for "low" filters
-    fat_limit = filters['max_fat'] if filters['max_fat'] is not None else (3.0 if filters['low_fat'] else None)
-    fiber_limit = filters['max_fiber'] if filters['max_fiber'] is not None else (3.0 if filters['low_fiber'] else None)
-    sugar_limit = filters['max_sugar'] if filters['max_sugar'] is not None else (5.0 if filters['low_sugar'] else None)
-    salt_limit = filters['max_salt'] if filters['max_salt'] is not None else (0.3 if filters['low_salt'] else None)
-    calorie_limit = filters['max_calories']
-    min_calorie_limit = filters['min_calories']
-    min_fiber_limit = filters['min_fiber']
-    min_protein_limit = filters['min_protein']
-    max_protein_limit = filters['max_protein']
-    # Format the product name for URL (replace spaces with +)
-    formatted_name = product_name.replace(" ", "+")
-    url = f"https://world.openfoodfacts.org/cgi/search.pl?search_terms={formatted_name}&search_simple=1&action=process&json=1"
+    # Resolve the active nutrient filters once; an explicit limit takes precedence over a "low" flag default
+    active_filters = []
+    try:
+        for param, low_flag, default_limit, nutrient, bound, summary in NUTRIENT_FILTERS:
+            limit = params.get(param)
+            if limit is None and low_flag is not None and params.get(low_flag, False):
+                limit = default_limit
+            if limit is not None:
+                active_filters.append((nutrient, float(limit), bound, summary.format(limit=limit)))
+    except (TypeError, ValueError):
+        logger.error("Invalid nutrient limit in search_food_product: %s", params)
+        return {"success": False, "message": "Nutrient limits must be numbers."}
+    
+    has_nutrient_filters = no_nuts or bool(active_filters)
+    filter_summary_text = describe_nutrient_filters(active_filters, no_nuts) if has_nutrient_filters else ""
+    # Nutrients shown next to each result, once each even if both a min and a max are set
+    displayed_nutrients = [nutrient for nutrient in NUTRIENT_DISPLAY_FORMATS if any(nutrient == f[0] for f in active_filters)]
+    
+    search_params = {
+        "search_terms": product_name, "search_simple": 1, "action": "process", "json": 1,
+        "fields": OFF_PRODUCT_FIELDS
+    }
     
     try:
-        response = requests.get(url, timeout=80)
+        response = SESSION.get(OFF_SEARCH_URL, params=search_params, timeout=SEARCH_TIMEOUT)
+        logger.info("Search response for '%s' served from cache: %s", product_name, response.from_cache)
         if response.status_code == 200:
-            search_data = response.json()
+            search_data = parse_json_response(response)
             
             products = search_data.get('products', [])
             if not products:
-                logging.info(f"No products found for: {product_name}")
+                logger.info("No products found for: %s", product_name)
                 return {
                     "success": True,
                     "message": f"No products found for '{product_name}'. Try a different search term."
@@ -198,133 +526,32 @@ def search_food_product(params: dict = None) -> dict:
             total_checked = 0
             
             # Helper function to check nutrient filters
-            def meets_nutrient_filters(product):
+            def meets_nutrient_filters(product, nutrient_values):
                 """Check if product meets the specified nutrient filtering criteria"""
-                nutriments = product.get('nutriments', {})
-                ingredients_text = product.get('ingredients_text', '').lower()
-                allergens = product.get('allergens_tags', [])
-                
                 # Check nuts filter
-                if filters['no_nuts']:
-                    nuts_keywords = [
-                        'nuts', 'nut', 'almond', 'walnut', 'peanut', 'cashew', 
-                        'pistachio', 'hazelnut', 'pecan', 'macadamia', 'brazil nut',
-                        'pine nut', 'chestnut', 'beechnut', 'hickory nut',
-                        'may contain nuts', 'may contain nut', 'tree nuts'
-                    ]
-                    
-                    # Check allergens tags for nut-related allergens
-                    has_nut_allergen = any('nut' in allergen.lower() for allergen in allergens)
-                    
-                    # Check ingredients text for nut keywords
-                    has_nut_ingredient = any(nut in ingredients_text for nut in nuts_keywords)
-                    
-                    # Check additional fields where nuts might be mentioned, but be smart about percentages
-                    additional_fields_to_check = [
-                        product.get('product_name', '').lower(),
-                        product.get('generic_name', '').lower(),
-                        product.get('categories', '').lower(),
-                        product.get('labels', '').lower(),
-                        product.get('traces', '').lower(),
-                        product.get('ingredients_analysis_tags', []),
-                        product.get('categories_tags', []),
-                        product.get('labels_tags', [])
-                    ]
-                    
-                    # Check nutriments field more carefully for percentage values
-                    nutriments_str = str(product.get('nutriments', {})).lower()
-                    has_nut_in_nutriments = False
-                    if any(nut in nutriments_str for nut in nuts_keywords):
-                        # Found nuts keywords in nutriments, now check if percentage is > 0
-                        import re
-                        # Look for patterns like "nuts...X%" where X is the percentage
-                        # Match the entire phrase containing nuts and extract the percentage
-                        nuts_percentage_matches = re.findall(r'[^{}\'"]*(?:nuts|nut|walnut|almond|peanut|cashew|pistachio|hazelnut|pecan|macadamia)[^{}\'"]*?(\d+(?:\.\d+)?)\s*%', nutriments_str, re.IGNORECASE)
-                        
-                        if nuts_percentage_matches:
-                            # Check if any percentage is > 0
-                            for percentage_str in nuts_percentage_matches:
-                                try:
-                                    percentage = float(percentage_str)
-                                    if percentage > 0:
-                                        has_nut_in_nutriments = True
-                                        break
-                                except ValueError:
-                                    continue
-                        else:
-                            # If no percentage pattern found but nuts keyword exists, check if it's a general mention
-                            # But be conservative - don't flag unless we're sure
-                            if any(phrase in nutriments_str for phrase in ['may contain nuts', 'may contain nut', 'contains nuts', 'contains nut']):
-                                has_nut_in_nutriments = True
-                    
-                    # Check all other additional fields for nuts keywords (excluding nutriments which we handled above)
-                    has_nut_in_additional_fields = False
-                    for field in additional_fields_to_check:
-                        if isinstance(field, str):
-                            if any(nut in field for nut in nuts_keywords):
-                                has_nut_in_additional_fields = True
-                                break
-                        elif isinstance(field, list):
-                            if any(any(nut in str(item).lower() for nut in nuts_keywords) for item in field):
-                                has_nut_in_additional_fields = True
-                                break
-                    
-                    if has_nut_allergen or has_nut_ingredient or has_nut_in_nutriments or has_nut_in_additional_fields:
-                        return False, "Contains nuts"
+                if no_nuts and product_contains_nuts(product):
+                    return False, "Contains nuts"
                 
                 # Check nutrient limits
-                limits = [
-                    (calorie_limit, 'energy-kcal_100g', 'energy-kcal', 'Calories'),
-                    (fat_limit, 'fat_100g', 'fat', 'Fat'),
-                    (fiber_limit, 'fiber_100g', 'fiber', 'Fiber'),
-                    (sugar_limit, 'sugars_100g', 'sugars', 'Sugar'),
-                    (salt_limit, 'salt_100g', 'salt', 'Salt')
-                ]
-                
-                for limit, key1, key2, name in limits:
-                    if limit is not None:
-                        value = nutriments.get(key1, nutriments.get(key2, None))
-                        if value is not None and float(value) > limit:
-                            return False, f"{name}: {value}g/100g (limit: {limit}g)"
-                
-                # Check protein limits separately (min and max)
-                protein_value = nutriments.get('proteins_100g', nutriments.get('proteins', None))
-                if protein_value is not None:
-                    protein_value = float(protein_value)
-                    if min_protein_limit is not None and protein_value < min_protein_limit:
-                        return False, f"Protein: {protein_value}g/100g (minimum: {min_protein_limit}g)"
-                    if max_protein_limit is not None and protein_value > max_protein_limit:
-                        return False, f"Protein: {protein_value}g/100g (maximum: {max_protein_limit}g)"
-                
-                # Check minimum calorie limits
-                if min_calorie_limit is not None:
-                    calorie_value = nutriments.get('energy-kcal_100g', nutriments.get('energy-kcal', None))
-                    if calorie_value is not None and float(calorie_value) < min_calorie_limit:
-                        return False, f"Calories: {calorie_value} kcal/100g (minimum: {min_calorie_limit} kcal)"
-                
-                # Check minimum fiber limits
-                if min_fiber_limit is not None:
-                    fiber_value = nutriments.get('fiber_100g', nutriments.get('fiber', None))
-                    if fiber_value is not None and float(fiber_value) < min_fiber_limit:
-                        return False, f"Fiber: {fiber_value}g/100g (minimum: {min_fiber_limit}g)"
+                for nutrient, limit, bound, _ in active_filters:
+                    value = nutrient_values[nutrient]
+                    if value is None:
+                        continue
+                    value = float(value)
+                    if bound == 'max' and value > limit:
+                        return False, f"{nutrient.capitalize()}: {value}/100g (limit: {limit})"
+                    if bound == 'min' and value < limit:
+                        return False, f"{nutrient.capitalize()}: {value}/100g (minimum: {limit})"
                 
                 return True, None
             
-            for i, product in enumerate(products):
-                total_checked += 1
-                
+            # Check at most the first 50 products
+            for total_checked, product in enumerate(products[:50], start=1):
                 # First check nutrient filters if any are specified
-                has_nutrient_filters = any([
-                    filters['low_fat'], filters['low_fiber'], filters['low_sugar'], 
-                    filters['low_salt'], filters['no_nuts'], calorie_limit is not None,
-                    min_calorie_limit is not None, fat_limit is not None, 
-                    fiber_limit is not None, min_fiber_limit is not None,
-                    sugar_limit is not None, salt_limit is not None,
-                    min_protein_limit is not None, max_protein_limit is not None
-                ])
-                
                 if has_nutrient_filters:
-                    meets_filters, filter_reason = meets_nutrient_filters(product)
+                    # Look up the nutrient values once for both the filters and the summary line
+                    nutrient_values = extract_nutrient_values(product.get('nutriments', {}))
+                    meets_filters, filter_reason = meets_nutrient_filters(product, nutrient_values)
                     if not meets_filters:
                         continue  # Skip products that don't meet nutrient filters
                 
@@ -333,8 +560,8 @@ def search_food_product(params: dict = None) -> dict:
                 brand = product.get('brands', 'Unknown Brand')
                 
                 # Clean up the text
-                product_name_result = ''.join(c for c in product_name_result if c.isprintable() and c.isascii()) if product_name_result else 'Unknown Product'
-                brand = ''.join(c for c in brand if c.isprintable() and c.isascii()) if brand else 'Unknown Brand'
+                product_name_result = clean_text(product_name_result) if product_name_result else 'Unknown Product'
+                brand = clean_text(brand) if brand else 'Unknown Brand'
                 
                 # Analyze product safety against user profile
                 is_safe, warnings, recommendations = analyze_product_safety(product)
@@ -351,40 +578,11 @@ def search_food_product(params: dict = None) -> dict:
                 
                 # Add nutrient info if filters were applied
                 if has_nutrient_filters:
-                    nutriments = product.get('nutriments', {})
                     nutrient_info = []
-                    if calorie_limit is not None:
-                        calories = nutriments.get('energy-kcal_100g', nutriments.get('energy-kcal', 'N/A'))
-                        if calories != 'N/A':
-                            nutrient_info.append(f"{calories} kcal")
-                    if min_calorie_limit is not None:
-                        calories = nutriments.get('energy-kcal_100g', nutriments.get('energy-kcal', 'N/A'))
-                        if calories != 'N/A':
-                            nutrient_info.append(f"{calories} kcal")
-                    if fat_limit is not None:
-                        fat = nutriments.get('fat_100g', nutriments.get('fat', 'N/A'))
-                        if fat != 'N/A':
-                            nutrient_info.append(f"{fat}g fat")
-                    if sugar_limit is not None:
-                        sugar = nutriments.get('sugars_100g', nutriments.get('sugars', 'N/A'))
-                        if sugar != 'N/A':
-                            nutrient_info.append(f"{sugar}g sugar")
-                    if salt_limit is not None:
-                        salt = nutriments.get('salt_100g', nutriments.get('salt', 'N/A'))
-                        if salt != 'N/A':
-                            nutrient_info.append(f"{salt}g salt")
-                    if fiber_limit is not None:
-                        fiber = nutriments.get('fiber_100g', nutriments.get('fiber', 'N/A'))
-                        if fiber != 'N/A':
-                            nutrient_info.append(f"{fiber}g fiber")
-                    if min_fiber_limit is not None:
-                        fiber = nutriments.get('fiber_100g', nutriments.get('fiber', 'N/A'))
-                        if fiber != 'N/A':
-                            nutrient_info.append(f"{fiber}g fiber")
-                    if min_protein_limit is not None or max_protein_limit is not None:
-                        protein = nutriments.get('proteins_100g', nutriments.get('proteins', 'N/A'))
-                        if protein != 'N/A':
-                            nutrient_info.append(f"{protein}g protein")
+                    for nutrient in displayed_nutrients:
+                        value = nutrient_values[nutrient]
+                        if value is not None:
+                            nutrient_info.append(NUTRIENT_DISPLAY_FORMATS[nutrient].format(value))
                     
                     if nutrient_info:
                         result_line += f" | {', '.join(nutrient_info)}"
@@ -395,65 +593,21 @@ def search_food_product(params: dict = None) -> dict:
                 if warnings:
                     profile_warnings.extend([f"Product {len(filtered_results)}: {w}" for w in warnings])
                 
-                # Stop after finding 10 results or checking 50 products
-                if len(filtered_results) >= 10 or total_checked >= 50:
+                # Stop after finding 10 results
+                if len(filtered_results) >= 10:
                     break
             
             
             # Generate response message
             if not filtered_results:
                 if has_nutrient_filters:
-                    filter_summary = []
-                    if filters['low_fat'] or fat_limit is not None:
-                        filter_summary.append(f"Low fat (≤{fat_limit}g)")
-                    if filters['low_fiber'] or fiber_limit is not None:
-                        filter_summary.append(f"Low fiber (≤{fiber_limit}g)")
-                    if filters['low_sugar'] or sugar_limit is not None:
-                        filter_summary.append(f"Low sugar (≤{sugar_limit}g)")
-                    if filters['low_salt'] or salt_limit is not None:
-                        filter_summary.append(f"Low salt (≤{salt_limit}g)")
-                    if filters['no_nuts']:
-                        filter_summary.append("No nuts")
-                    if calorie_limit is not None:
-                        filter_summary.append(f"≤{calorie_limit} calories")
-                    if min_calorie_limit is not None:
-                        filter_summary.append(f"≥{min_calorie_limit} calories")
-                    if min_fiber_limit is not None:
-                        filter_summary.append(f"≥{min_fiber_limit}g fiber")
-                    if min_protein_limit is not None:
-                        filter_summary.append(f"≥{min_protein_limit}g protein")
-                    if max_protein_limit is not None:
-                        filter_summary.append(f"≤{max_protein_limit}g protein")
-                    
-                    message = f"No products found for '{product_name}' matching your filters: {', '.join(filter_summary)}.\n"
+                    message = f"No products found for '{product_name}' matching your filters: {filter_summary_text}.\n"
                     message += f"Checked {total_checked} products. Try relaxing some filters or using different search terms."
                 else:
                     message = f"No products found for '{product_name}'. Try a different search term."
             else:
                 if has_nutrient_filters:
-                    filter_summary = []
-                    if filters['low_fat'] or fat_limit is not None:
-                        filter_summary.append(f"Low fat (≤{fat_limit}g)")
-                    if filters['low_fiber'] or fiber_limit is not None:
-                        filter_summary.append(f"Low fiber (≤{fiber_limit}g)")
-                    if filters['low_sugar'] or sugar_limit is not None:
-                        filter_summary.append(f"Low sugar (≤{sugar_limit}g)")
-                    if filters['low_salt'] or salt_limit is not None:
-                        filter_summary.append(f"Low salt (≤{salt_limit}g)")
-                    if filters['no_nuts']:
-                        filter_summary.append("No nuts")
-                    if calorie_limit is not None:
-                        filter_summary.append(f"≤{calorie_limit} calories")
-                    if min_calorie_limit is not None:
-                        filter_summary.append(f"≥{min_calorie_limit} calories")
-                    if min_fiber_limit is not None:
-                        filter_summary.append(f"≥{min_fiber_limit}g fiber")
-                    if min_protein_limit is not None:
-                        filter_summary.append(f"≥{min_protein_limit}g protein")
-                    if max_protein_limit is not None:
-                        filter_summary.append(f"≤{max_protein_limit}g protein")
-                    
-                    message = f"Found {len(filtered_results)} products for '{product_name}' matching filters: {', '.join(filter_summary)}\n"
+                    message = f"Found {len(filtered_results)} products for '{product_name}' matching filters: {filter_summary_text}\n"
                     message += f"(Checked {total_checked} total products)\n\n"
                 else:
                     message = f"Found {len(products)} products:\n"
@@ -466,7 +620,7 @@ def search_food_product(params: dict = None) -> dict:
                 elif not has_nutrient_filters and len(products) > len(filtered_results):
                     message += f"\n... and {len(products) - len(filtered_results)} more results."
             
-            message += f"\n\nNote: These results are for reference only. Please check the actual product packaging for the most accurate information."
+            message += REFERENCE_NOTE
             
             # Add safety indicator explanation if user has a profile
             global USER_PROFILE
@@ -484,42 +638,43 @@ def search_food_product(params: dict = None) -> dict:
                 if len(profile_warnings) > 10:
                     message += f"\n... and {len(profile_warnings) - 10} more warnings."
             
-            logging.info(f"Product search successful for: {product_name}")
+            logger.info("Product search successful for: %s", product_name)
             return {
                 "success": True,
                 "message": message
             }
         else:
-            logging.error(f"Failed to search products for: {product_name}. Status code: {response.status_code}")
+            logger.error("Failed to search products for: %s. Status code: %s", product_name, response.status_code)
             return {"success": False, "message": f"Failed to search products. Status code: {response.status_code}"}
     except requests.Timeout:
-        logging.error(f"Timeout while searching products for: {product_name}")
+        logger.error("Timeout while searching products for: %s", product_name)
         return {"success": False, "message": "Request timed out. Please try again."}
     except requests.RequestException as e:
-        logging.error(f"Request error while searching products for: {product_name}. Error: {str(e)}")
+        logger.error("Request error while searching products for: %s. Error: %s", product_name, e)
         return {"success": False, "message": f"Error searching products: {str(e)}"}
     except json.JSONDecodeError as e:
-        logging.error(f"Failed to parse search results for: {product_name}. Error: {str(e)}")
+        logger.error("Failed to parse search results for: %s. Error: %s", product_name, e)
         return {"success": False, "message": "Failed to parse search results."}
     except Exception as e:
-        logging.error(f"Unexpected error while searching products for: {product_name}. Error: {str(e)}")
+        logger.error("Unexpected error while searching products for: %s. Error: %s", product_name, e)
         return {"success": False, "message": f"An unexpected error occurred: {str(e)}"}
 
 def get_product_nutrition(params: dict = None) -> dict:
     """Retrieve detailed nutritional information for a product by barcode."""
     if not params or "barcode" not in params:
-        logging.error("Barcode parameter is required in get_product_nutrition")
+        logger.error("Barcode parameter is required in get_product_nutrition")
         return {"success": False, "message": "Barcode parameter is required."}
     
     barcode = params["barcode"]
     url = f"https://world.openfoodfacts.org/api/v0/product/{barcode}.json"
     try:
-        response = requests.get(url, timeout=10)
+        response = SESSION.get(url, params={"fields": OFF_PRODUCT_FIELDS}, timeout=PRODUCT_TIMEOUT)
+        logger.info("Product response for barcode %s served from cache: %s", barcode, response.from_cache)
         if response.status_code == 200:
-            product_data = response.json()
+            product_data = parse_json_response(response)
             
             if product_data.get('status') != 1:
-                logging.info(f"Product not found for barcode: {barcode}")
+                logger.info("Product not found for barcode: %s", barcode)
                 return {
                     "success": False,
                     "message": f"Product with barcode '{barcode}' not found."
@@ -535,31 +690,32 @@ def get_product_nutrition(params: dict = None) -> dict:
             nutriments = product.get('nutriments', {})
             
             # Get key nutritional values (per 100g)
-            energy_kcal = nutriments.get('energy-kcal_100g', nutriments.get('energy-kcal', 'N/A'))
-            fat = nutriments.get('fat_100g', nutriments.get('fat', 'N/A'))
-            sugar = nutriments.get('sugars_100g', nutriments.get('sugars', 'N/A'))
-            protein = nutriments.get('proteins_100g', nutriments.get('proteins', 'N/A'))
-            salt = nutriments.get('salt_100g', nutriments.get('salt', 'N/A'))
-            fiber = nutriments.get('fiber_100g', nutriments.get('fiber', 'N/A'))
+            nutrient_values = extract_nutrient_values(nutriments)
+            energy_kcal = nutrient_values['calories']
+            fat = nutrient_values['fat']
+            sugar = nutrient_values['sugar']
+            protein = nutrient_values['protein']
+            salt = nutrient_values['salt']
+            fiber = nutrient_values['fiber']
             
             # Clean up the text
-            product_name = ''.join(c for c in product_name if c.isprintable() and c.isascii()) if product_name else 'Unknown Product'
-            brand = ''.join(c for c in brand if c.isprintable() and c.isascii()) if brand else 'Unknown Brand'
+            product_name = clean_text(product_name) if product_name else 'Unknown Product'
+            brand = clean_text(brand) if brand else 'Unknown Brand'
             
             # Format the nutritional information
             nutrition_parts = []
             
-            if energy_kcal != 'N/A':
+            if energy_kcal is not None:
                 nutrition_parts.append(f"\n• Energy: {energy_kcal} kcal/100g")
-            if fat != 'N/A':
+            if fat is not None:
                 nutrition_parts.append(f"\n• Fat: {fat}g")
-            if sugar != 'N/A':
+            if sugar is not None:
                 nutrition_parts.append(f"\n• Sugar: {sugar}g")
-            if protein != 'N/A':
+            if protein is not None:
                 nutrition_parts.append(f"\n• Protein: {protein}g")
-            if salt != 'N/A':
+            if salt is not None:
                 nutrition_parts.append(f"\n• Salt: {salt}g")
-            if fiber != 'N/A':
+            if fiber is not None:
                 nutrition_parts.append(f"\n• Fiber: {fiber}g")
             
             if nutrition_parts:
@@ -572,46 +728,43 @@ def get_product_nutrition(params: dict = None) -> dict:
             is_safe, warnings, recommendations = analyze_product_safety(product)
             
             if warnings or recommendations:
-                message += "\n• 🔍 DIETARY ANALYSIS:"
-                for warning in warnings:
-                    message += f"\n• {warning}"
-                for recommendation in recommendations:
-                    message += f"\n• {recommendation}"
+                analysis_lines = [message, "🔍 DIETARY ANALYSIS:", *warnings, *recommendations]
                 
                 if not is_safe:
-                    message += "\n• ❌ This product is NOT RECOMMENDED for your dietary profile."
+                    analysis_lines.append("❌ This product is NOT RECOMMENDED for your dietary profile.")
                 elif warnings:
-                    message += "\n• ⚠️ Please review the warnings above before consuming."
+                    analysis_lines.append("⚠️ Please review the warnings above before consuming.")
                 else:
-                    message += "\n• ✅ This product appears suitable for your dietary profile."
+                    analysis_lines.append("✅ This product appears suitable for your dietary profile.")
+                message = "\n• ".join(analysis_lines)
             
-            logging.info(f"Nutritional data retrieved successfully for barcode: {barcode}")
+            logger.info("Nutritional data retrieved successfully for barcode: %s", barcode)
             return {
                 "success": True,
                 "message": message
             }
         else:
-            logging.error(f"Failed to retrieve product data for barcode: {barcode}. Status code: {response.status_code}")
+            logger.error("Failed to retrieve product data for barcode: %s. Status code: %s", barcode, response.status_code)
             return {"success": False, "message": f"Failed to retrieve product data. Status code: {response.status_code}"}
     except requests.Timeout:
-        logging.error(f"Timeout while retrieving product data for barcode: {barcode}")
+        logger.error("Timeout while retrieving product data for barcode: %s", barcode)
         return {"success": False, "message": "Request timed out. Please try again."}
     except requests.RequestException as e:
-        logging.error(f"Request error while retrieving product data for barcode: {barcode}. Error: {str(e)}")
+        logger.error("Request error while retrieving product data for barcode: %s. Error: %s", barcode, e)
         return {"success": False, "message": f"Error retrieving product data: {str(e)}"}
     except json.JSONDecodeError as e:
-        logging.error(f"Failed to parse product data for barcode: {barcode}. Error: {str(e)}")
+        logger.error("Failed to parse product data for barcode: %s. Error: %s", barcode, e)
         return {"success": False, "message": "Failed to parse product data."}
     except Exception as e:
-        logging.error(f"Unexpected error while retrieving product data for barcode: {barcode}. Error: {str(e)}")
+        logger.error("Unexpected error while retrieving product data for barcode: %s. Error: %s", barcode, e)
         return {"success": False, "message": f"An unexpected error occurred: {str(e)}"}
 
 def set_user_profile(params: dict = None) -> dict:
     """Set the user's dietary profile for filtering food products."""
-    global USER_PROFILE
+    global USER_PROFILE, PROFILE_LOOKUPS
     
     if not params:
-        logging.error("Profile data is required in set_user_profile")
+        logger.error("Profile data is required in set_user_profile")
         return {"success": False, "message": "Profile data is required."}
     
     # Parse and validate parameters
@@ -628,18 +781,25 @@ def set_user_profile(params: dict = None) -> dict:
         parsed_profile["nutrient_limits"] = safe_parse_parameter(params.get("nutrient_limits"), dict)
         
         # Only add non-None values to the profile
-        USER_PROFILE = {k: v for k, v in parsed_profile.items() if v is not None}
+        profile = normalize_profile({k: v for k, v in parsed_profile.items() if v is not None})
+        # The profile is only committed once its lookups have been built from it
+        lookups = build_profile_lookups(profile)
+        USER_PROFILE, PROFILE_LOOKUPS = profile, lookups
         
         profile_name = USER_PROFILE.get("profile_name", "Custom Profile")
-        save_user_profile()
+        if not save_user_profile():
+            return {
+                "success": True,
+                "message": f"Profile '{profile_name}' has been set, but it could not be saved and will be lost when the plugin restarts. Dietary restrictions and preferences will now be applied to all food searches automatically."
+            }
         
-        logging.info(f"User profile set and saved: {profile_name}")
+        logger.info("User profile set and saved: %s", profile_name)
         return {
             "success": True,
             "message": f"Profile '{profile_name}' has been set and saved successfully. Dietary restrictions and preferences will now be applied to all food searches automatically."
         }
     except Exception as e:
-        logging.error(f"Error setting user profile: {str(e)}")
+        logger.error("Error setting user profile: %s", e)
         return {
             "success": False,
             "message": f"Error setting user profile: {str(e)}"
@@ -659,50 +819,50 @@ def get_user_profile(params: dict = None) -> dict:
     allergies = USER_PROFILE.get("allergies", [])
     intolerances = USER_PROFILE.get("intolerances", [])
     medical_conditions = USER_PROFILE.get("medical_conditions", [])
-    dietary_preferences = USER_PROFILE.get("dietary_preferences", {})
+    active_prefs = PROFILE_LOOKUPS.get("active_prefs", "")
     avoid_additives = USER_PROFILE.get("avoid_additives", [])
     nutrient_limits = USER_PROFILE.get("nutrient_limits", {})
     
-    summary = f"📋 Current Profile: {profile_name}"
+    summary_lines = [f"📋 Current Profile: {profile_name}"]
     
     if allergies:
-        summary += f"\n🚨 Allergies: {', '.join(allergies)}"
+        summary_lines.append(f"🚨 Allergies: {', '.join(allergies)}")
     if intolerances:
-        summary += f"\n⚠️ Intolerances: {', '.join(intolerances)}"
+        summary_lines.append(f"⚠️ Intolerances: {', '.join(intolerances)}")
     if medical_conditions:
-        summary += f"\n🏥 Medical Conditions: {', '.join(medical_conditions)}"
+        summary_lines.append(f"🏥 Medical Conditions: {', '.join(medical_conditions)}")
     
-    if dietary_preferences and isinstance(dietary_preferences, dict):
-        active_prefs = [k for k, v in dietary_preferences.items() if v]
-        if active_prefs:
-            summary += f"\n🥗 Dietary Preferences: {', '.join(active_prefs)}"
+    if active_prefs:
+        summary_lines.append(f"🥗 Dietary Preferences: {active_prefs}")
     
     if avoid_additives and isinstance(avoid_additives, list):
-        summary += f"\n🧪 Avoid Additives: {', '.join(avoid_additives)}"
+        summary_lines.append(f"🧪 Avoid Additives: {', '.join(avoid_additives)}")
     
     if nutrient_limits and isinstance(nutrient_limits, dict):
         limits = [f"{nutrient}: {limit}" for nutrient, limit in nutrient_limits.items()]
         if limits:
-            summary += f"\n📊 Nutrient Limits: {', '.join(limits)}"
+            summary_lines.append(f"📊 Nutrient Limits: {', '.join(limits)}")
     
-    summary += "\n\n✅ This profile is automatically applied to all food searches."
+    summary_lines.append("\n✅ This profile is automatically applied to all food searches.")
+    summary = "\n".join(summary_lines)
     
     return {"success": True, "message": summary, "profile_data": USER_PROFILE}
 
 def clear_user_profile(params: dict = None) -> dict:
     """Clear the current user profile and remove the saved profile file."""
-    global USER_PROFILE, PROFILE_FILE
+    global USER_PROFILE, PROFILE_LOOKUPS, PROFILE_FILE, LAST_SAVED_PROFILE
     
-    USER_PROFILE = None
+    USER_PROFILE, PROFILE_LOOKUPS = None, {}
+    LAST_SAVED_PROFILE = None
     
     try:
         if os.path.exists(PROFILE_FILE):
             os.remove(PROFILE_FILE)
-            logging.info("User profile file deleted")
+            logger.info("User profile file deleted")
     except Exception as e:
-        logging.error(f"Failed to delete profile file: {str(e)}")
+        logger.error("Failed to delete profile file: %s", e)
     
-    logging.info("User profile cleared")
+    logger.info("User profile cleared")
     return {
         "success": True,
         "message": "User profile has been cleared successfully. No dietary restrictions will be applied to future searches until a new profile is set."
@@ -721,7 +881,7 @@ def analyze_product_safety(product_data: dict, strict_mode: bool = False) -> tup
     """
     global USER_PROFILE
     
-    if USER_PROFILE is None:
+    if USER_PROFILE is None or not PROFILE_LOOKUPS.get("has_restrictions", True):
         return True, [], []
     
     warnings = []
@@ -729,85 +889,20 @@ def analyze_product_safety(product_data: dict, strict_mode: bool = False) -> tup
     is_safe = True
     
     # Check allergies
-    allergies = USER_PROFILE.get("allergies", [])
-    allergens = product_data.get("allergens_tags", [])
+    allergens = [allergen.lower() for allergen in product_data.get("allergens_tags", [])]
     ingredients_text = product_data.get("ingredients_text", "").lower()
     
-    for allergy in allergies:
-        allergy_lower = allergy.lower()
+    for allergy, allergy_lower in PROFILE_LOOKUPS.get("allergies", []):
         
         # Enhanced nuts detection
         if allergy_lower in ['nuts', 'nut', 'tree nuts']:
-            nuts_keywords = [
-                'nuts', 'nut', 'almond', 'walnut', 'peanut', 'cashew', 
-                'pistachio', 'hazelnut', 'pecan', 'macadamia', 'brazil nut',
-                'pine nut', 'chestnut', 'beechnut', 'hickory nut', 
-                'may contain nuts', 'may contain nut', 'tree nuts'
-            ]
-            
-            # Check allergens tags for nut-related allergens
-            has_nut_allergen = any('nut' in allergen.lower() for allergen in allergens)
-            
-            # Check ingredients text for nut keywords
-            has_nut_ingredient = any(nut in ingredients_text for nut in nuts_keywords)
-            
-            # Check additional fields where nuts might be mentioned, but be smart about percentages
-            additional_fields_to_check = [
-                product_data.get('product_name', '').lower(),
-                product_data.get('generic_name', '').lower(),
-                product_data.get('categories', '').lower(),
-                product_data.get('labels', '').lower(),
-                product_data.get('traces', '').lower(),
-                product_data.get('ingredients_analysis_tags', []),
-                product_data.get('categories_tags', []),
-                product_data.get('labels_tags', [])
-            ]
-            
-            # Check nutriments field more carefully for percentage values
-            nutriments_str = str(product_data.get('nutriments', {})).lower()
-            has_nut_in_nutriments = False
-            if any(nut in nutriments_str for nut in nuts_keywords):
-                # Found nuts keywords in nutriments, now check if percentage is > 0
-                import re
-                # Look for patterns like "nuts...X%" where X is the percentage
-                # Match the entire phrase containing nuts and extract the percentage
-                nuts_percentage_matches = re.findall(r'[^{}\'"]*(?:nuts|nut|walnut|almond|peanut|cashew|pistachio|hazelnut|pecan|macadamia)[^{}\'"]*?(\d+(?:\.\d+)?)\s*%', nutriments_str, re.IGNORECASE)
-                
-                if nuts_percentage_matches:
-                    # Check if any percentage is > 0
-                    for percentage_str in nuts_percentage_matches:
-                        try:
-                            percentage = float(percentage_str)
-                            if percentage > 0:
-                                has_nut_in_nutriments = True
-                                break
-                        except ValueError:
-                            continue
-                else:
-                    # If no percentage pattern found but nuts keyword exists, check if it's a general mention
-                    # But be conservative - don't flag unless we're sure
-                    if any(phrase in nutriments_str for phrase in ['may contain nuts', 'may contain nut', 'contains nuts', 'contains nut']):
-                        has_nut_in_nutriments = True
-            
-            # Check all other additional fields for nuts keywords (excluding nutriments which we handled above)
-            has_nut_in_additional_fields = False
-            for field in additional_fields_to_check:
-                if isinstance(field, str):
-                    if any(nut in field for nut in nuts_keywords):
-                        has_nut_in_additional_fields = True
-                        break
-                elif isinstance(field, list):
-                    if any(any(nut in str(item).lower() for nut in nuts_keywords) for item in field):
-                        has_nut_in_additional_fields = True
-                        break
-            
-            if has_nut_allergen or has_nut_ingredient or has_nut_in_nutriments or has_nut_in_additional_fields:
+            if product_contains_nuts(product_data):
                 warnings.append(f"⚠️ ALLERGY WARNING: Contains {allergy}")
                 is_safe = False
                 
         else:
             # Standard allergy checking for other allergens
-            if any(allergy_lower in allergen.lower() for allergen in allergens) or allergy_lower in ingredients_text:
+            if any(allergy_lower in allergen for allergen in allergens) or allergy_lower in ingredients_text:
                 warnings.append(f"⚠️ ALLERGY WARNING: Contains {allergy}")
                 is_safe = False
     
@@ -821,37 +916,38 @@ def analyze_product_safety(product_data: dict, strict_mode: bool = False) -> tup
                 is_safe = False
     
     # Check nutrient limits
-    nutrient_limits = USER_PROFILE.get("nutrient_limits", {})
     nutriments = product_data.get("nutriments", {})
     
-    if isinstance(nutrient_limits, dict):
-        for nutrient, limit in nutrient_limits.items():
-            value = nutriments.get(nutrient, nutriments.get(nutrient.replace("_100g", ""), 0))
-            if isinstance(value, (int, float)) and value > limit:
-                warnings.append(f"⚠️ HIGH {nutrient.replace('_100g', '').upper()}: {value}g (limit: {limit}g)")
-                if strict_mode:
-                    is_safe = False
+    for nutrient, short_nutrient, limit in PROFILE_LOOKUPS.get("nutrient_limits", []):
+        value = nutriments.get(nutrient, nutriments.get(short_nutrient, 0))
+        if isinstance(value, (int, float)) and value > limit:
+            warnings.append(f"⚠️ HIGH {short_nutrient.upper()}: {value}g (limit: {limit}g)")
+            if strict_mode:
+                is_safe = False
     
     # Check dietary preferences
     dietary_prefs = USER_PROFILE.get("dietary_preferences", {})
     
-    # Helper function for vegan/vegetarian checking
-    def check_diet_status(diet_type, non_diet_indicators):
-        diet_labels = product_data.get("labels_tags", [])
-        is_explicitly_labeled = any(diet_type in label.lower() for label in diet_labels)
+    # Label tags lowercased once for both diet checks; the separator never appears in a diet name
+    labels_text = '|'.join(product_data.get("labels_tags", [])).lower()
+    
+    # Helper function for vegan/vegetarian checking (ingredients_text is already lowercase)
+    def check_diet_status(diet_type, non_diet_indicators, non_diet_re):
+        is_explicitly_labeled = diet_type in labels_text
         
-        if f"{diet_type} status unknown" in ingredients_text.lower():
+        if f"{diet_type} status unknown" in ingredients_text:
             warnings.append(f"⚠️ {diet_type.upper()} STATUS UNKNOWN: Product explicitly states unknown {diet_type} status")
             return False
         elif is_explicitly_labeled:
             return True
         else:
             found_non_diet = False
-            for indicator in non_diet_indicators:
-                if indicator in ingredients_text.lower():
-                    warnings.append(f"⚠️ NOT {diet_type.upper()}: Contains {indicator}")
-                    found_non_diet = True
-                    return False
+            if non_diet_re.search(ingredients_text):
+                for indicator in non_diet_indicators:
+                    if indicator in ingredients_text:
+                        warnings.append(f"⚠️ NOT {diet_type.upper()}: Contains {indicator}")
+                        found_non_diet = True
+                        return False
             
             if not found_non_diet and (not ingredients_text or len(ingredients_text.strip()) < 20):
                 warnings.append(f"⚠️ {diet_type.upper()} STATUS UNKNOWN: Insufficient ingredient information" + (" - FILTERED OUT" if strict_mode else ""))
@@ -860,13 +956,11 @@ def analyze_product_safety(product_data: dict, strict_mode: bool = False) -> tup
             return True
     
     if dietary_prefs.get("vegan", False):
-        non_vegan_indicators = ["milk", "egg", "meat", "fish", "honey", "gelatin", "whey", "casein", "dairy", "cheese", "butter", "cream", "lactose", "chicken", "beef", "pork", "bacon", "lard"]
-        if not check_diet_status("vegan", non_vegan_indicators):
+        if not check_diet_status("vegan", NON_VEGAN_INDICATORS, NON_VEGAN_RE):
             is_safe = False
 
     if dietary_prefs.get("vegetarian", False):
-        non_vegetarian_indicators = ["meat", "fish", "chicken", "beef", "pork", "bacon", "lard", "gelatin", "anchovies", "tuna", "salmon", "cod"]
-        if not check_diet_status("vegetarian", non_vegetarian_indicators):
+        if not check_diet_status("vegetarian", NON_VEGETARIAN_INDICATORS, NON_VEGETARIAN_RE):
             is_safe = False
     
     # Check avoided additives
@@ -901,13 +995,16 @@ def search_vegan_products(product_name: str) -> list:
     """
     try:
         # First try direct vegan label search
-        formatted_name = product_name.replace(" ", "+")
         # Use the v1 search API with vegan label filter
-        url = f"https://world.openfoodfacts.org/cgi/search.pl?search_terms={formatted_name}&tagtype_0=labels&tag_contains_0=contains&tag_0=vegan&search_simple=1&action=process&json=1"
+        search_params = {
+            "search_terms": product_name, "tagtype_0": "labels", "tag_contains_0": "contains",
+            "tag_0": "vegan", "search_simple": 1, "action": "process", "json": 1,
+            "fields": OFF_PRODUCT_FIELDS, "page_size": SAFE_SEARCH_PAGE_SIZE
+        }
         
-        response = requests.get(url, timeout=10)
+        response = SESSION.get(OFF_SEARCH_URL, params=search_params, timeout=LABEL_SEARCH_TIMEOUT)
         if response.status_code == 200:
-            search_data = response.json()
+            search_data = parse_json_response(response)
             products = search_data.get('products', [])
             
             # FILTER: Only return products that actually have "vegan" in their labels
@@ -918,14 +1015,16 @@ def search_vegan_products(product_name: str) -> list:
                     vegan_products.append(product)
             
             if vegan_products:
-                logging.info(f"Found {len(vegan_products)} verified vegan-labeled products for: {product_name}")
+                logger.info("Found %s verified vegan-labeled products for: %s", len(vegan_products), product_name)
                 return vegan_products
         
         # Fallback: try using the direct URL approach
-        url = f"https://world.openfoodfacts.org/label/vegan/search/{formatted_name}.json"
-        response = requests.get(url, timeout=10)
+        url = f"https://world.openfoodfacts.org/label/vegan/search/{quote_plus(product_name)}.json"
+        response = SESSION.get(
+            url, params={"fields": OFF_PRODUCT_FIELDS, "page_size": SAFE_SEARCH_PAGE_SIZE}, timeout=LABEL_SEARCH_TIMEOUT
+        )
         if response.status_code == 200:
-            search_data = response.json()
+            search_data = parse_json_response(response)
             products = search_data.get('products', [])
             
             # FILTER: Only return products that actually have "vegan" in their labels
@@ -936,11 +1035,11 @@ def search_vegan_products(product_name: str) -> list:
                     vegan_products.append(product)
             
             if vegan_products:
-                logging.info(f"Found {len(vegan_products)} verified vegan products via label URL for: {product_name}")
+                logger.info("Found %s verified vegan products via label URL for: %s", len(vegan_products), product_name)
                 return vegan_products
                 
     except Exception as e:
-        logging.warning(f"Error in vegan-specific search for {product_name}: {str(e)}")
+        logger.warning("Error in vegan-specific search for %s: %s", product_name, e)
     
     return []
 
@@ -957,13 +1056,16 @@ def search_vegetarian_products(product_name: str) -> list:
     """
     try:
         # First try direct vegetarian label search
-        formatted_name = product_name.replace(" ", "+")
         # Use the v1 search API with vegetarian label filter
-        url = f"https://world.openfoodfacts.org/cgi/search.pl?search_terms={formatted_name}&tagtype_0=labels&tag_contains_0=contains&tag_0=vegetarian&search_simple=1&action=process&json=1"
+        search_params = {
+            "search_terms": product_name, "tagtype_0": "labels", "tag_contains_0": "contains",
+            "tag_0": "vegetarian", "search_simple": 1, "action": "process", "json": 1,
+            "fields": OFF_PRODUCT_FIELDS, "page_size": SAFE_SEARCH_PAGE_SIZE
+        }
         
-        response = requests.get(url, timeout=10)
+        response = SESSION.get(OFF_SEARCH_URL, params=search_params, timeout=LABEL_SEARCH_TIMEOUT)
         if response.status_code == 200:
-            search_data = response.json()
+            search_data = parse_json_response(response)
             products = search_data.get('products', [])
             
             # FILTER: Only return products that actually have "vegetarian" in their labels
@@ -974,14 +1076,16 @@ def search_vegetarian_products(product_name: str) -> list:
                     vegetarian_products.append(product)
             
             if vegetarian_products:
-                logging.info(f"Found {len(vegetarian_products)} verified vegetarian-labeled products for: {product_name}")
+                logger.info("Found %s verified vegetarian-labeled products for: %s", len(vegetarian_products), product_name)
                 return vegetarian_products
         
         # Fallback: try using the direct URL approach
-        url = f"https://world.openfoodfacts.org/label/vegetarian/search/{formatted_name}.json"
-        response = requests.get(url, timeout=10)
+        url = f"https://world.openfoodfacts.org/label/vegetarian/search/{quote_plus(product_name)}.json"
+        response = SESSION.get(
+            url, params={"fields": OFF_PRODUCT_FIELDS, "page_size": SAFE_SEARCH_PAGE_SIZE}, timeout=LABEL_SEARCH_TIMEOUT
+        )
         if response.status_code == 200:
-            search_data = response.json()
+            search_data = parse_json_response(response)
             products = search_data.get('products', [])
             
             # FILTER: Only return products that actually have "vegetarian" in their labels
@@ -992,14 +1096,37 @@ def search_vegetarian_products(product_name: str) -> list:
                     vegetarian_products.append(product)
             
             if vegetarian_products:
-                logging.info(f"Found {len(vegetarian_products)} verified vegetarian products via label URL for: {product_name}")
+                logger.info("Found %s verified vegetarian products via label URL for: %s", len(vegetarian_products), product_name)
                 return vegetarian_products
                 
     except Exception as e:
-        logging.warning(f"Error in vegetarian-specific search for {product_name}: {str(e)}")
+        logger.warning("Error in vegetarian-specific search for %s: %s", product_name, e)
     
     return []
 
+def fetch_search_products(product_name: str) -> list:
+    """
+    Run a plain Open Food Facts text search and return the raw product list.
+    
+    Args:
+        product_name (str): The product name to search for
+        
+    Returns:
+        list: Products from the search response, or an empty list on a non-200 status
+        
+    Raises:
+        requests.RequestException: If the request fails
+        json.JSONDecodeError: If the response body is not valid JSON
+    """
+    search_params = {
+        "search_terms": product_name, "search_simple": 1, "action": "process", "json": 1,
+        "fields": OFF_PRODUCT_FIELDS, "page_size": SAFE_SEARCH_PAGE_SIZE
+    }
+    response = SESSION.get(OFF_SEARCH_URL, params=search_params, timeout=LABEL_SEARCH_TIMEOUT)
+    if response.status_code == 200:
+        return parse_json_response(response).get('products', [])
+    return []
+
 def search_safe_food_only(params: dict = None) -> dict:
     """
     Searches for food products by name and returns ONLY products that are safe for the user's dietary profile.
@@ -1026,7 +1153,7 @@ def search_safe_food_only(params: dict = None) -> dict:
     global USER_PROFILE
     
     if not params or "product_name" not in params:
-        logging.error("Product name parameter is required in search_safe_food_only")
+        logger.error("Product name parameter is required in search_safe_food_only")
         return {"success": False, "message": "Product name parameter is required."}
     
     if USER_PROFILE is None:
@@ -1037,168 +1164,111 @@ def search_safe_food_only(params: dict = None) -> dict:
     
     product_name = params["product_name"]
     
-    # Try enhanced search with API filters first if user is vegan or vegetarian
+    # Profile fields used for the search and for both result messages
+    allergies = USER_PROFILE.get("allergies", [])
+    intolerances = USER_PROFILE.get("intolerances", [])
     dietary_prefs = USER_PROFILE.get("dietary_preferences", {})
+    
+    # Try enhanced search with API filters first if user is vegan or vegetarian
     safe_products = []
     safe_product_barcodes = []  # Track barcodes for URL generation
     total_checked = 0
     
+    # Barcodes already analyzed; the general search often repeats products from the label search
+    checked_barcodes = set()
+    
+    def collect_safe_products(products, safe_tag, max_checked):
+        """Analyze products in order, appending formatted safe ones until the check or result limit is hit"""
+        nonlocal total_checked
+        for product in products:
+            if total_checked >= max_checked or len(safe_products) >= 10:
+                break
+            barcode = product.get('code', 'N/A')
+            if barcode in checked_barcodes:
+                continue
+            if product.get('code'):
+                checked_barcodes.add(barcode)
+            total_checked += 1
+            
+            # STRICT analysis - filter out ANY products with unknown status
+            is_safe, warnings, recommendations = analyze_product_safety(product, strict_mode=True)
+            
+            # STRICT: Only include products that are completely safe (no warnings at all)
+            if is_safe and not warnings:
+                product_name_result = product.get('product_name', 'Unknown Product')
+                brand = product.get('brands', 'Unknown Brand')
+                
+                # Clean up the text
+                product_name_result = clean_text(product_name_result) if product_name_result else 'Unknown Product'
+                brand = clean_text(brand) if brand else 'Unknown Brand'
+                
+                result_line = f"{len(safe_products)+1}. **{product_name_result} ({brand})**\nhttps://world.openfoodfacts.org/product/{barcode} ✅ {safe_tag}"
+                safe_products.append(result_line)
+                safe_product_barcodes.append(barcode)
+    
     # If user is vegan, try to search specifically for vegan products first
     if dietary_prefs.get("vegan", False):
-        vegan_products = search_vegan_products(product_name)
-        if vegan_products:
-            for product in vegan_products[:10]:
-                total_checked += 1
-                is_safe, warnings, recommendations = analyze_product_safety(product, strict_mode=True)
-                
-                # STRICT: Only include products that are completely safe with NO warnings
-                if is_safe and not warnings:
-                    product_name_result = product.get('product_name', 'Unknown Product')
-                    barcode = product.get('code', 'N/A')
-                    brand = product.get('brands', 'Unknown Brand')
-                    
-                    # Clean up the text
-                    product_name_result = ''.join(c for c in product_name_result if c.isprintable() and c.isascii()) if product_name_result else 'Unknown Product'
-                    brand = ''.join(c for c in brand if c.isprintable() and c.isascii()) if brand else 'Unknown Brand'
-                    
-                    result_line = f"{len(safe_products)+1}. **{product_name_result} ({brand})**\nhttps://world.openfoodfacts.org/product/{barcode} ✅ VEGAN SAFE"
-                    safe_products.append(result_line)
-                    safe_product_barcodes.append(barcode)
-                    
-                    if len(safe_products) >= 10:
-                        break
+        collect_safe_products(search_vegan_products(product_name), "VEGAN SAFE", max_checked=10)
     
     # If user is vegetarian (and not vegan), try to search specifically for vegetarian products
     elif dietary_prefs.get("vegetarian", False):
-        vegetarian_products = search_vegetarian_products(product_name)
-        if vegetarian_products:
-            for product in vegetarian_products[:10]:
-                total_checked += 1
-                is_safe, warnings, recommendations = analyze_product_safety(product, strict_mode=True)
-                
-                # STRICT: Only include products that are completely safe with NO warnings
-                if is_safe and not warnings:
-                    product_name_result = product.get('product_name', 'Unknown Product')
-                    barcode = product.get('code', 'N/A')
-                    brand = product.get('brands', 'Unknown Brand')
-                    
-                    # Clean up the text
-                    product_name_result = ''.join(c for c in product_name_result if c.isprintable() and c.isascii()) if product_name_result else 'Unknown Product'
-                    brand = ''.join(c for c in brand if c.isprintable() and c.isascii()) if brand else 'Unknown Brand'
-                    
-                    result_line = f"{len(safe_products)+1}. **{product_name_result} ({brand})**\nhttps://world.openfoodfacts.org/product/{barcode} ✅ VEGETARIAN SAFE"
-                    safe_products.append(result_line)
-                    safe_product_barcodes.append(barcode)
-                    
-                    if len(safe_products) >= 10:
-                        break
+        collect_safe_products(search_vegetarian_products(product_name), "VEGETARIAN SAFE", max_checked=10)
     
     # If we didn't find enough products with vegan-specific search, do general search
     if len(safe_products) < 5:
-        formatted_name = product_name.replace(" ", "+")
-        url = f"https://world.openfoodfacts.org/cgi/search.pl?search_terms={formatted_name}&search_simple=1&action=process&json=1"
-        
         try:
-            response = requests.get(url, timeout=10)
-            if response.status_code == 200:
-                search_data = response.json()
-                products = search_data.get('products', [])
-                
-                for product in products[:20]:  # Check more products to find safe ones
-                    if total_checked >= 20:  # Limit total products checked
-                        break
-                    total_checked += 1
-                    
-                    # STRICT analysis - filter out ANY products with unknown status
-                    is_safe, warnings, recommendations = analyze_product_safety(product, strict_mode=True)
-                    
-                    # STRICT: Only include products that are completely safe (no warnings at all)
-                    if is_safe and not warnings:
-                        product_name_result = product.get('product_name', 'Unknown Product')
-                        barcode = product.get('code', 'N/A')
-                        brand = product.get('brands', 'Unknown Brand')
-                        
-                        # Clean up the text
-                        product_name_result = ''.join(c for c in product_name_result if c.isprintable() and c.isascii()) if product_name_result else 'Unknown Product'
-                        brand = ''.join(c for c in brand if c.isprintable() and c.isascii()) if brand else 'Unknown Brand'
-                        
-                        result_line = f"{len(safe_products)+1}. **{product_name_result} ({brand})**\nhttps://world.openfoodfacts.org/product/{barcode} ✅ SAFE"
-                        safe_products.append(result_line)
-                        safe_product_barcodes.append(barcode)
-                        
-                        # Stop after finding 10 safe products
-                        if len(safe_products) >= 10:
-                            break
+            # Check more products to find safe ones, up to 20 in total
+            collect_safe_products(fetch_search_products(product_name), "SAFE", max_checked=20)
         
-        except requests.RequestException as e:
-            logging.error(f"Error searching for products: {str(e)}")
+        except (requests.RequestException, json.JSONDecodeError) as e:
+            logger.error("Error searching for products: %s", e)
             return {"success": False, "message": f"Error searching for products: {str(e)}"}
     
     if not safe_products:
-        message = f"❌ No completely safe products found for '{product_name}' using STRICT filtering.\n\n"
-        message += f"Checked {total_checked} products. All were filtered out due to:\n"
-        message += f"• Allergen conflicts\n• Unknown vegan/vegetarian status\n• Nutrient limit violations\n• Missing critical information\n\n"
+        message_parts = [
+            f"❌ No completely safe products found for '{product_name}' using STRICT filtering.\n\n",
+            f"Checked {total_checked} products. All were filtered out due to:\n",
+            SAFE_SEARCH_FILTER_REASONS,
+        ]
         
         # Remind user of their restrictions
-        allergies = USER_PROFILE.get("allergies", [])
-        intolerances = USER_PROFILE.get("intolerances", [])
-        dietary_prefs = USER_PROFILE.get("dietary_preferences", {})
-        
         if allergies:
-            message += f"🚨 Allergies to avoid: {', '.join(allergies)}\n"
+            message_parts.append(f"🚨 Allergies to avoid: {', '.join(allergies)}\n")
         if intolerances:
-            message += f"⚠️ Intolerances: {', '.join(intolerances)}\n"
+            message_parts.append(f"⚠️ Intolerances: {', '.join(intolerances)}\n")
         if dietary_prefs.get("vegan"):
-            message += f"🥗 Vegan requirement (strict - excludes unknown status)\n"
+            message_parts.append(SAFE_SEARCH_VEGAN_REMINDER)
         if dietary_prefs.get("vegetarian"):
-            message += f"🥛 Vegetarian requirement (strict - excludes unknown status)\n"
+            message_parts.append(SAFE_SEARCH_VEGETARIAN_REMINDER)
         
-        message += f"\n💡 Try: \n- Use regular search to see products with warnings\n- Try different/broader search terms\n- Use analyze_product to check specific barcodes\n- Consider adjusting your dietary profile if needed"
+        message_parts.append(SAFE_SEARCH_TRY_HINT)
         
-        message += f"\n\nNote: These results are for reference only. Please check the actual product packaging for the most accurate information."
-
+        message_parts.append(REFERENCE_NOTE)
+        message = "".join(message_parts)
 
-        logging.info(f"No safe products found for: {product_name}")
+        logger.info("No safe products found for: %s", product_name)
         return {
             "success": True,
             "message": message
         }
     
-    message = f"🎯 Found {len(safe_products)} SAFE products for '{product_name}' (checked {total_checked} total):\n\n"
-    message += "\n".join(safe_products)
+    message_parts = [
+        f"🎯 Found {len(safe_products)} SAFE products for '{product_name}' (checked {total_checked} total):\n\n",
+        "\n".join(safe_products),
+    ]
     
     if len(safe_products) == 10:
-        message += f"\n\n📝 Showing first 10 safe results. There may be more safe options available."
+        message_parts.append(SAFE_SEARCH_MORE_RESULTS)
     
-    message += f"\n\n• All listed products meet your dietary requirements:\n"
+    message_parts.append(SAFE_SEARCH_REQUIREMENTS_HEADER)
     
-    # Show what requirements were checked
-    profile_summary = []
-    allergies = USER_PROFILE.get("allergies", [])
-    intolerances = USER_PROFILE.get("intolerances", [])
-    dietary_prefs = USER_PROFILE.get("dietary_preferences", {})
-    nutrient_limits = USER_PROFILE.get("nutrient_limits", {})
-    
-    if allergies:
-        profile_summary.append(f"No {', '.join(allergies)} allergens")
-    if intolerances:
-        profile_summary.append(f"No {', '.join(intolerances)}")
-    if dietary_prefs.get("vegan"):
-        profile_summary.append("Vegan-friendly")
-    if dietary_prefs.get("vegetarian"):
-        profile_summary.append("Vegetarian-friendly")
-    if nutrient_limits and isinstance(nutrient_limits, dict):
-        limits_text = []
-        for nutrient, limit in nutrient_limits.items():
-            nutrient_clean = nutrient.replace("_100g", "")
-            limits_text.append(f"{nutrient_clean} ≤ {limit}g")
-        if limits_text:
-            profile_summary.append(f"Within limits: {', '.join(limits_text)}")
-    
-    if profile_summary:
-        message += "✅ " + "\n".join(profile_summary)
+    # Show what requirements were checked (precomputed when the profile changes)
+    safe_summary = PROFILE_LOOKUPS.get("safe_summary")
+    if safe_summary:
+        message_parts.append(safe_summary)
     
-    message += f"\n\nNote: These results are for reference only. Please check the actual product packaging for the most accurate information."
+    message_parts.append(REFERENCE_NOTE)
+    message = "".join(message_parts)
     
     # Generate URL for the first safe product (if any)
     response_dict = {
@@ -1214,13 +1284,13 @@ def search_safe_food_only(params: dict = None) -> dict:
     elif safe_products:
         # Extract barcode from first product line (format: "Barcode: XXXXXXXXX")
         first_product = safe_products[0]
-        barcode_match = re.search(r'Barcode: (\w+)', first_product)
+        barcode_match = BARCODE_RE.search(first_product)
         if barcode_match:
             first_barcode = barcode_match.group(1)
             if first_barcode != 'N/A':
                 response_dict["url"] = f"https://world.openfoodfacts.org/product/{first_barcode}"
     
-    logging.info(f"Safe products search successful for: {product_name}, found {len(safe_products)} safe products")
+    logger.info("Safe products search successful for: %s, found %s safe products", product_name, len(safe_products))
     return response_dict
 
 def main():
@@ -1240,9 +1310,13 @@ def main():
     }
     
     while True:
-        command = read_command()
+        try:
+            command = read_command()
+        except EOFError:
+            logger.info('Command pipe closed, exiting')
+            return
         if command is None:
-            logging.error('Error reading command - skipping and continuing')
+            logger.error('Error reading command - skipping and continuing')
             # Send an error response to prevent the caller from hanging
             error_response = {"success": False, "message": "Failed to parse command"}
             write_response(error_response)
@@ -1250,169 +1324,261 @@ def main():
         
         tool_calls = command.get("tool_calls", [])
         for tool_call in tool_calls:
-            logging.info(f"Tool call: {tool_call}")
             func = tool_call.get("func")
-            logging.info(f"Function: {func}")
             params = tool_call.get("params", {})
-            logging.info(f"Params: {params}")
             
-            if func == 'initialize':
-                response = commands.get('initialize')(params)
-            elif func == 'search_food_product':
-                logging.info(f"Searching food products for {params}")
-                response = search_food_product(params)
-                logging.info(f"Search result: {response}")
-            elif func == 'get_product_nutrition':
-                logging.info(f"Getting nutrition info for {params}")
-                response = get_product_nutrition(params)
-                logging.info(f"Nutrition info: {response}")
-            elif func == 'set_user_profile':
-                logging.info(f"Setting user profile: {params}")
-                response = set_user_profile(params)
-                logging.info(f"Profile set result: {response}")
-            elif func == 'get_user_profile':
-                logging.info("Getting user profile")
-                response = get_user_profile(params)
-                logging.info(f"Profile info: {response}")
-            elif func == 'clear_user_profile':
-                logging.info("Clearing user profile")
-                response = clear_user_profile(params)
-                logging.info(f"Profile clear result: {response}")
-            elif func == 'search_safe_food_only':
-                logging.info(f"Searching safe food only for {params}")
-                response = search_safe_food_only(params)
-                logging.info(f"Safe search result: {response}")
-            elif func == 'shutdown':
-                response = commands.get('shutdown')(params)
-                write_response(response)
-                return
-            else:
+            # Only a string can name a command; e.g. ["x"] or {} would not even be hashable
+            handler = commands.get(func) if isinstance(func, str) else None
+            if handler is None:
+                logger.warning("Unknown function call: %s", tool_call)
                 response = {'success': False, 'message': "Unknown function call"}
+            else:
+                logger.info("Calling %s with %s", func, params)
+                try:
+                    response = handler(params)
+                except Exception as e:
+                    logger.exception("Unhandled exception in %s", func)
+                    response = {"success": False, "message": f"Error in {func}: {str(e)}"}
+                logger.info("%s result: %s", func, response)
             
+            # Each response is its own write, so the host gets it as soon as its call is done
             write_response(response)
+            if func == 'shutdown':
+                return
     
-def read_command() -> dict | None:
-    """Read a command from the communication pipe."""
-    try:
-        STD_INPUT_HANDLE = -10
-        pipe = windll.kernel32.GetStdHandle(STD_INPUT_HANDLE)
+# Shared decoder for commands; raw_decode stops at the end of the first JSON value
+JSON_DECODER = json.JSONDecoder()
 
-        chunks = []
-        while True:
-            BUFFER_SIZE = 4096
-            message_bytes = wintypes.DWORD()
-            buffer = bytes(BUFFER_SIZE)
-            success = windll.kernel32.ReadFile(pipe, buffer, BUFFER_SIZE, byref(message_bytes), None)
+PIPE_BUFFER_SIZE = 65536
+
+# Commands are read straight into this buffer. It is reused for every command and only
+# grows when a command doesn't fit.
+PIPE_READ_BUFFER = bytearray(2 * PIPE_BUFFER_SIZE)
 
+def make_windows_pipe_io():
+    """
+    Build the command reader and response writer on kernel32 ReadFile/WriteFile and the standard handles.
+    
+    The handles never change for the life of the process, so they are looked up once here.
+    Declaring the signatures lets ctypes convert arguments without guessing their types on
+    every call, and keeps 64-bit HANDLE values from being truncated to int.
+    
+    Returns:
+        tuple: (read_message, write) functions, see make_posix_pipe_io
+    """
+    kernel32 = windll.kernel32
+    kernel32.GetStdHandle.argtypes = [wintypes.DWORD]
+    kernel32.GetStdHandle.restype = wintypes.HANDLE
+    kernel32.GetLastError.restype = wintypes.DWORD
+    read_file = kernel32.ReadFile
+    read_file.argtypes = [wintypes.HANDLE, wintypes.LPVOID, wintypes.DWORD, wintypes.LPDWORD, wintypes.LPVOID]
+    read_file.restype = wintypes.BOOL
+    write_file = kernel32.WriteFile
+    write_file.argtypes = [wintypes.HANDLE, wintypes.LPCVOID, wintypes.DWORD, wintypes.LPDWORD, wintypes.LPVOID]
+    write_file.restype = wintypes.BOOL
+    
+    STD_INPUT_HANDLE = -10
+    STD_OUTPUT_HANDLE = -11
+    ERROR_BROKEN_PIPE = 109
+    ERROR_MORE_DATA = 234
+    stdin_pipe = kernel32.GetStdHandle(STD_INPUT_HANDLE)
+    stdout_pipe = kernel32.GetStdHandle(STD_OUTPUT_HANDLE)
+    bytes_transferred = wintypes.DWORD()
+    
+    def read_message() -> Optional[int]:
+        # Each read lands right after the bytes received so far
+        total = 0
+        while True:
+            if len(PIPE_READ_BUFFER) - total < PIPE_BUFFER_SIZE:
+                PIPE_READ_BUFFER.extend(bytes(len(PIPE_READ_BUFFER)))
+            target = (c_char * PIPE_BUFFER_SIZE).from_buffer(PIPE_READ_BUFFER, total)
+            success = read_file(stdin_pipe, target, PIPE_BUFFER_SIZE, byref(bytes_transferred), None)
+            # Release the view of the buffer, so it can be resized on the next read
+            del target
+            bytes_read = bytes_transferred.value
+            
             if not success:
-                logging.error('Error reading from command pipe')
+                error = kernel32.GetLastError()
+                if error == ERROR_BROKEN_PIPE and total == 0:
+                    raise EOFError('command pipe closed')
+                if error == ERROR_BROKEN_PIPE:
+                    return total
+                if error != ERROR_MORE_DATA:
+                    return None
+                # A message-mode pipe has more of this message waiting
+                total += bytes_read
+                continue
+            
+            if bytes_read == 0 and total == 0:
+                raise EOFError('command pipe closed')
+            total += bytes_read
+            # The host writes each command with a single WriteFile, so a read that doesn't fill
+            # the buffer has reached the end of it
+            if bytes_read < PIPE_BUFFER_SIZE:
+                return total
+    
+    def write(data: bytes) -> bool:
+        return bool(write_file(stdout_pipe, data, len(data), byref(bytes_transferred), None))
+    
+    return read_message, write
+
+def make_posix_pipe_io():
+    """
+    Build the command reader and response writer on the stdin/stdout file descriptors.
+    
+    Used when the plugin runs outside Windows, e.g. driven by a local test harness. A byte
+    stream has no message boundaries, so commands are read one per line (JSON encoders
+    escape newlines inside strings); the last command may also end at end of input.
+    
+    Returns:
+        tuple: (read_message, write) functions. read_message() reads the next command into
+        the start of PIPE_READ_BUFFER and returns its length, or None on a read error, and
+        raises EOFError once the input is closed. write(data) writes all of data and
+        returns False on failure.
+    """
+    # PIPE_READ_BUFFER[message_end:filled] holds bytes read past the end of the last command
+    message_end = 0
+    filled = 0
+    
+    def read_message() -> Optional[int]:
+        nonlocal message_end, filled
+        # Move the start of the next command to the front of the buffer
+        leftover = filled - message_end
+        PIPE_READ_BUFFER[:leftover] = PIPE_READ_BUFFER[message_end:filled]
+        filled, message_end = leftover, 0
+        scanned = 0
+        while True:
+            newline = PIPE_READ_BUFFER.find(b'\n', scanned, filled)
+            if newline != -1:
+                message_end = newline + 1
+                return newline
+            scanned = filled
+            
+            if len(PIPE_READ_BUFFER) - filled < PIPE_BUFFER_SIZE:
+                PIPE_READ_BUFFER.extend(bytes(len(PIPE_READ_BUFFER)))
+            try:
+                with memoryview(PIPE_READ_BUFFER)[filled:filled + PIPE_BUFFER_SIZE] as target:
+                    bytes_read = os.readv(0, [target])
+            except OSError:
                 return None
             
-            chunk = buffer.decode('utf-8')[:message_bytes.value]
-            chunks.append(chunk)
+            if bytes_read == 0:
+                if filled == 0:
+                    raise EOFError('command input closed')
+                message_end = filled
+                return filled
+            filled += bytes_read
+    
+    def write(data: bytes) -> bool:
+        try:
+            with memoryview(data) as remaining:
+                while remaining:
+                    remaining = remaining[os.write(1, remaining):]
+            return True
+        except OSError:
+            return False
+    
+    return read_message, write
 
-            if message_bytes.value < BUFFER_SIZE:
-                break
+PIPE_READ_MESSAGE, PIPE_WRITE = make_windows_pipe_io() if sys.platform == 'win32' else make_posix_pipe_io()
+
+# A double-quoted JSON string value, including escaped characters
+JSON_STRING_RE = re.compile(r'"([^"]*(?:\\.[^"]*)*)"')
 
-        retval = ''.join(chunks)
+def fix_newlines_in_strings(match):
+    """Escape raw newlines, carriage returns and tabs inside a matched JSON string value."""
+    content = match.group(1)
+    # Replace unescaped newlines with \\n
+    content = content.replace('\n', '\\n').replace('\r', '\\r').replace('\t', '\\t')
+    return f'"{content}"'
+
+def read_command() -> dict | None:
+    """
+    Read a command from the communication pipe.
+    
+    Raises:
+        EOFError: If the host has closed the pipe
+    """
+    try:
+        # The whole message is decoded once it has been read, so a multi-byte UTF-8
+        # character split across two reads is decoded correctly
+        message_length = PIPE_READ_MESSAGE()
+        if message_length is None:
+            logger.error('Error reading from command pipe')
+            return None
+
+        with memoryview(PIPE_READ_BUFFER)[:message_length] as message_view:
+            # Well-formed commands are parsed straight from the bytes; only a message that
+            # orjson rejects is decoded to a string for the slower handling below
+            try:
+                return orjson.loads(message_view)
+            except orjson.JSONDecodeError:
+                retval = str(message_view, 'utf-8')
         
         # Clean up the JSON string before parsing
         retval = retval.strip()
         
-        # Handle potential multiple JSON objects concatenated together
-        def extract_first_json(data):
-            """Extract the first complete JSON object from potentially concatenated data"""
-            if not data:
-                return None
-                
-            brace_count = 0
-            in_string = False
-            escape_next = False
-            
-            for i, char in enumerate(data):
-                if escape_next:
-                    escape_next = False
-                    continue
-                    
-                if char == '\\' and in_string:
-                    escape_next = True
-                    continue
-                    
-                if char == '"' and not escape_next:
-                    in_string = not in_string
-                    continue
-                    
-                if not in_string:
-                    if char == '{':
-                        brace_count += 1
-                    elif char == '}':
-                        brace_count -= 1
-                        if brace_count == 0:
-                            # Found the end of the first JSON object
-                            return data[:i+1]
-            
-            # If we didn't find a complete JSON object, return the whole string
-            return data
-        
-        # Extract only the first JSON object if multiple are present
-        first_json = extract_first_json(retval)
-        if first_json != retval:
-            logging.warning(f'Multiple JSON objects detected, extracted first one. Original length: {len(retval)}, extracted: {len(first_json)}')
-        
-        # Try to parse the JSON with better error handling
+        # Parse the first JSON object; anything after it (e.g. a second concatenated command) is ignored
         try:
-            return json.loads(first_json)
+            command, end = JSON_DECODER.raw_decode(retval)
+            if end != len(retval):
+                logger.warning('Multiple JSON objects detected, extracted first one. Original length: %s, extracted: %s', len(retval), end)
+            return command
         except json.JSONDecodeError as json_err:
             # Log first 500 characters of problematic JSON for debugging
-            json_preview = first_json[:500] + "..." if len(first_json) > 500 else first_json
-            logging.error(f'JSON decode error at position {json_err.pos}: {json_err.msg}')
-            logging.error(f'Received invalid JSON (first 500 chars): {json_preview}')
+            json_preview = retval[:500] + "..." if len(retval) > 500 else retval
+            logger.error('JSON decode error at position %s: %s', json_err.pos, json_err.msg)
+            logger.error('Received invalid JSON (first 500 chars): %s', json_preview)
             
             # Try to fix common JSON issues
             try:
-                import re
-                cleaned_json = first_json
-                
-                # Fix unescaped newlines within JSON string values
-                # This pattern looks for unescaped newlines that are inside quotes
-                def fix_newlines_in_strings(match):
-                    content = match.group(1)
-                    # Replace unescaped newlines with \\n
-                    content = content.replace('\n', '\\n').replace('\r', '\\r').replace('\t', '\\t')
-                    return f'"{content}"'
-                
                 # Find all string values in the JSON and fix newlines within them
-                cleaned_json = re.sub(r'"([^"]*(?:\\.[^"]*)*)"', fix_newlines_in_strings, cleaned_json)
+                cleaned_json = JSON_STRING_RE.sub(fix_newlines_in_strings, retval)
                 
-                return json.loads(cleaned_json)
+                return JSON_DECODER.raw_decode(cleaned_json)[0]
             except Exception as e:
-                logging.error(f'Failed to clean and parse JSON: {str(e)}')
+                logger.error('Failed to clean and parse JSON: %s', e)
                 return None
 
+    except EOFError:
+        raise
     except Exception as e:
-        logging.error(f'Exception in read_command(): {str(e)}')
+        logger.error('Exception in read_command(): %s', e)
         return None
 
 
-def write_response(response: Response) -> None:
-    """Write a response to the communication pipe."""
-    try:
-        STD_OUTPUT_HANDLE = -11
-        pipe = windll.kernel32.GetStdHandle(STD_OUTPUT_HANDLE)
+# Marks the end of each response on the pipe
+RESPONSE_TERMINATOR = b'<<END>>'
 
-        # Use ensure_ascii=False to preserve Unicode characters like emojis
-        json_message = json.dumps(response, ensure_ascii=False) + '<<END>>'
-        message_bytes = json_message.encode('utf-8')
-        message_len = len(message_bytes)
+# Sent in place of a response that cannot be encoded, so the caller still gets a framed reply
+ENCODE_ERROR_FRAME = orjson.dumps({"success": False, "message": "Failed to encode response"}) + RESPONSE_TERMINATOR
 
-        bytes_written = wintypes.DWORD()
-        success = windll.kernel32.WriteFile(pipe, message_bytes, message_len, bytes_written, None)
+def encode_response(response: Response) -> bytes:
+    """Encode a response and its terminator, falling back to ENCODE_ERROR_FRAME if it cannot be encoded."""
+    try:
+        try:
+            # orjson emits UTF-8 bytes directly and keeps Unicode characters like emojis as-is.
+            # Non-str keys, e.g. from an ast-parsed "{1: 2}" parameter, are written as strings.
+            return orjson.dumps(response, option=orjson.OPT_NON_STR_KEYS) + RESPONSE_TERMINATOR
+        except orjson.JSONEncodeError:
+            # e.g. integers wider than 64 bits, which orjson rejects but json writes as-is
+            return json.dumps(response, ensure_ascii=False).encode('utf-8') + RESPONSE_TERMINATOR
+    except Exception as e:
+        logger.error('Failed to encode response: %s', e)
+        return ENCODE_ERROR_FRAME
 
-        if not success:
-            logging.error('Error writing to response pipe')
+def write_response(response: Response) -> None:
+    """Write a response to the communication pipe."""
+    try:
+        if not PIPE_WRITE(encode_response(response)):
+            logger.error('Error writing to response pipe')
 
     except Exception as e:
-        logging.error(f'Exception in write_response(): {str(e)}')
+        logger.error('Exception in write_response(): %s', e)
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    except Exception:
+        logger.exception("Unhandled exception in main()")
+        raise